@@ -4,8 +4,13 @@ USB Gamepad Mapper for Mac
 Detects gamepad input and maps buttons to keyboard shortcuts
 """
 
+import ctypes
 import json
-import time
+import logging
+import logging.handlers
+import os
+import queue
+import re
 import threading
 import subprocess
 import sys
@@ -15,18 +20,127 @@ import pygame
 from pynput import keyboard
 from pynput.keyboard import Key, Controller
 
+# orjson is optional, the stdlib json module is used when it's missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Joystick event types drained by the input loop, axis motion only wakes
+# the loop and is discarded in bulk since axes are polled directly
+JOYSTICK_EVENTS = (
+    pygame.JOYBUTTONDOWN,
+    pygame.JOYBUTTONUP,
+    pygame.JOYDEVICEADDED,
+    pygame.JOYDEVICEREMOVED,
+)
+
+# Common button names indexed by button ID (may vary by controller)
+BUTTON_NAMES = (
+    "A",
+    "B",
+    "X",
+    "Y",
+    "LEFT_TRIGGER",
+    "RIGHT_TRIGGER",
+    "SELECT",
+    "START",
+    "LEFT_STICK",
+    "RIGHT_STICK",
+)
+
+# Axes polled for triggers (2, 3) and the D-pad (0, 1)
+AXES_OF_INTEREST = (0, 1, 2, 3)
+
+# D-pad directions per axis as (negative, positive)
+DPAD_AXIS_DIRECTIONS = {
+    0: ("LEFT", "RIGHT"),
+    1: ("UP", "DOWN"),
+}
+
+# Axes must fall below this fraction of the threshold to count as released,
+# so values dithering around the threshold don't re-trigger presses
+RELEASE_RATIO = 0.75
+
+# Real-time priority requested for the input thread on Linux
+INPUT_THREAD_PRIORITY = 10
+
+# macOS QoS class for latency-critical, user-facing work
+QOS_CLASS_USER_INTERACTIVE = 0x21
+
+# Some joystick backends only post events when explicitly pumped
+SAFETY_PUMP_INTERVAL = 10
+
 class GamepadMapper:
+    # Common gamepad identifiers
+    _GAMEPAD_RE = re.compile(r'gamepad|controller|xbox|playstation|nintendo', re.I)
+    
+    # Posted by stop() to wake an input thread blocked in event.wait
+    _WAKE = pygame.USEREVENT + 1
+    
+    # Key names accepted in button_mappings, anything else is typed as-is
+    _KEY_MAP = {
+        'space': ' ',
+        'return': Key.enter,
+        'escape': Key.esc,
+        'tab': Key.tab,
+        'f11': Key.f11,
+        'f12': Key.f12,
+        'ctrl': Key.ctrl,
+        'shift': Key.shift,
+        'alt': Key.alt,
+        'up': Key.up,
+        'down': Key.down,
+        'left': Key.left,
+        'right': Key.right,
+        'home': Key.home,
+        'end': Key.end,
+        'page_up': Key.page_up,
+        'page_down': Key.page_down,
+        'insert': Key.insert,
+        'delete': Key.delete,
+        'backspace': Key.backspace
+    }
+    
     def __init__(self, config_file: str = "gamepad_config.json"):
         self.config_file = Path(config_file)
         self.keyboard_controller = Controller()
         self.running = False
         self.gamepad = None
-        self.config = self.load_config()
+        self._instance_id = None
+        self.reload_config()
+        
+        # Key actuations run on a worker so the input loop never sleeps
+        self._key_q = queue.SimpleQueue()
+        self._key_thread = threading.Thread(target=self._key_worker, daemon=True)
+        self._key_thread.start()
+        
+        # Per-event-type handlers for the input loop
+        self._dispatch = {
+            pygame.JOYBUTTONDOWN: self._on_btn_down,
+            pygame.JOYBUTTONUP: self._on_btn_up,
+            pygame.JOYDEVICEADDED: self._on_device_added,
+            pygame.JOYDEVICEREMOVED: self._on_device_removed,
+        }
         
         # Initialize pygame for gamepad support
         pygame.init()
         pygame.joystick.init()
         
+        # Open joysticks by instance ID, kept current by hotplug events
+        self._joysticks = {}
+        self._register_joysticks()
+
+        # Only let SDL queue the events we actually handle
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(list(JOYSTICK_EVENTS) + [
+            pygame.JOYAXISMOTION,
+            pygame.QUIT,
+            self._WAKE,
+        ])
+        
     def load_config(self) -> Dict[str, Any]:
         """Load button mapping configuration from JSON file"""
         if not self.config_file.exists():
@@ -48,96 +162,134 @@ class GamepadMapper:
                 },
                 "trigger_threshold": 0.5,
                 "polling_rate": 60,
-                "auto_restart": True
+                "auto_restart": True,
+                "debug": False
             }
             self.save_config(default_config)
             return default_config
         
         try:
-            with open(self.config_file, 'r') as f:
-                return json.load(f)
+            data = self.config_file.read_bytes()
+            # orjson.JSONDecodeError subclasses json.JSONDecodeError
+            return orjson.loads(data) if orjson else json.loads(data)
         except (json.JSONDecodeError, FileNotFoundError):
             print(f"Error loading config from {self.config_file}")
             return {}
     
+    def reload_config(self) -> None:
+        """Load the configuration and rebind the values used by the input loop"""
+        self.config = self.load_config()
+        self._resolved = self.resolve_mappings()
+        
+        trigger_threshold = self.config.get("trigger_threshold", 0.5)
+        if not self._is_number(trigger_threshold) or trigger_threshold <= 0:
+            print(f"Invalid trigger_threshold {trigger_threshold!r}, using 0.5")
+            trigger_threshold = 0.5
+        self._trigger_threshold = float(trigger_threshold)
+        
+        polling_rate = self.config.get("polling_rate", 60)
+        if not self._is_number(polling_rate) or polling_rate <= 0:
+            print(f"Invalid polling_rate {polling_rate!r}, using 60")
+            polling_rate = 60
+        # event.wait(0) blocks forever, so never let the timeout round down to 0
+        self._wait_ms = max(1, int(1000 / polling_rate))
+        self._debug = bool(self.config.get("debug", False))
+        logger.setLevel(logging.DEBUG if self._debug else logging.INFO)
+    
+    @staticmethod
+    def _is_number(value: Any) -> bool:
+        """True for int/float config values, JSON true/false don't count"""
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    
     def save_config(self, config: Dict[str, Any]) -> None:
         """Save button mapping configuration to JSON file"""
         try:
-            with open(self.config_file, 'w') as f:
-                json.dump(config, f, indent=2)
+            if orjson:
+                data = orjson.dumps(config, option=orjson.OPT_INDENT_2)
+            else:
+                data = json.dumps(config, indent=2).encode()
+            self.config_file.write_bytes(data)
         except Exception as e:
             print(f"Error saving config: {e}")
     
-    def detect_gamepad(self) -> Optional[int]:
-        """Detect and return the first available gamepad"""
-        pygame.joystick.quit()
-        pygame.joystick.init()
+    def detect_gamepad(self) -> Optional[pygame.joystick.JoystickType]:
+        """Return the first open joystick that looks like a gamepad"""
+        for joystick in self._joysticks.values():
+            if self._GAMEPAD_RE.search(joystick.get_name()):
+                print(f"Found gamepad: {joystick.get_name()}")
+                return joystick
         
-        joystick_count = pygame.joystick.get_count()
-        if joystick_count > 0:
-            for i in range(joystick_count):
-                joystick = pygame.joystick.Joystick(i)
-                joystick.init()
-                name = joystick.get_name().lower()
-                
-                # Common gamepad identifiers
-                if any(keyword in name for keyword in ['gamepad', 'controller', 'xbox', 'playstation', 'nintendo']):
-                    print(f"Found gamepad: {joystick.get_name()}")
-                    return i
+        return None
+    
+    def wait_for_gamepad(self) -> Optional[pygame.joystick.JoystickType]:
+        """Block until a gamepad is plugged in and return it"""
+        while self.running:
+            # Time out now and then so Ctrl+C is still noticed
+            event = pygame.event.wait(1000)
+            
+            if event.type == pygame.QUIT:
+                self.running = False
+            elif event.type == pygame.JOYDEVICEADDED:
+                self._on_device_added(event)
+                gamepad = self.detect_gamepad()
+                if gamepad is not None:
+                    return gamepad
+            elif event.type == pygame.JOYDEVICEREMOVED:
+                self._on_device_removed(event)
         
         return None
     
     def get_key_from_string(self, key_string: str):
         """Convert string representation to pynput Key or character"""
-        key_mapping = {
-            'space': ' ',
-            'return': Key.enter,
-            'escape': Key.esc,
-            'tab': Key.tab,
-            'f11': Key.f11,
-            'f12': Key.f12,
-            'ctrl': Key.ctrl,
-            'shift': Key.shift,
-            'alt': Key.alt,
-            'up': Key.up,
-            'down': Key.down,
-            'left': Key.left,
-            'right': Key.right,
-            'home': Key.home,
-            'end': Key.end,
-            'page_up': Key.page_up,
-            'page_down': Key.page_down,
-            'insert': Key.insert,
-            'delete': Key.delete,
-            'backspace': Key.backspace
+        return self._KEY_MAP.get(key_string, key_string)
+    
+    def resolve_mappings(self) -> Dict[str, Any]:
+        """Resolve every configured button to its pynput Key or character"""
+        return {
+            button: self.get_key_from_string(key_string)
+            for button, key_string in self.config.get("button_mappings", {}).items()
         }
-        
-        return key_mapping.get(key_string, key_string)
     
     def press_key(self, key_string: str) -> None:
         """Press a key based on the string representation"""
-        key = self.get_key_from_string(key_string)
-        try:
-            self.keyboard_controller.press(key)
-            time.sleep(0.05)  # Brief press
-            self.keyboard_controller.release(key)
-        except Exception as e:
-            print(f"Error pressing key {key_string}: {e}")
+        self._press(self.get_key_from_string(key_string))
+    
+    def _press(self, key) -> None:
+        """Queue an already resolved key for the key worker"""
+        self._key_q.put(key)
+    
+    def _key_worker(self) -> None:
+        """Tap queued keys off the input thread"""
+        while True:
+            key = self._key_q.get()
+            try:
+                self.keyboard_controller.tap(key)
+            except Exception as e:
+                print(f"Error pressing key {key}: {e}")
     
     def handle_button_press(self, button_name: str) -> None:
         """Handle button press events"""
-        if button_name in self.config.get("button_mappings", {}):
-            key_mapping = self.config["button_mappings"][button_name]
-            print(f"Button {button_name} pressed -> {key_mapping}")
-            self.press_key(key_mapping)
+        key = self._resolved.get(button_name)
+        if key is not None:
+            if self._debug:
+                logger.debug("Button %s pressed -> %s", button_name, key)
+            self._press(key)
+    
+    def drain_events(self, timeout_ms: int) -> list:
+        """Wait for input, then collect every pending joystick event"""
+        event = pygame.event.wait(timeout_ms)
+        events = [event] if event.type != pygame.NOEVENT else []
+        
+        # A single get already returns every queued event of these types
+        events.extend(pygame.event.get(JOYSTICK_EVENTS, pump=False))
+        return events
     
     def run_gamepad_loop(self) -> None:
         """Main gamepad input loop"""
-        if not self.gamepad:
+        if self.gamepad is None:
             return
         
-        joystick = pygame.joystick.Joystick(self.gamepad)
-        joystick.init()
+        joystick = self.gamepad
         
         print(f"Gamepad connected: {joystick.get_name()}")
         print("Button mappings:")
@@ -146,97 +298,204 @@ class GamepadMapper:
         print("Press Ctrl+C to exit")
         
         # Track button states to avoid repeated presses
-        button_states = {}
-        trigger_states = {"left": False, "right": False}
+        self._instance_id = joystick.get_instance_id()
+        self._connected = True
+        self._button_states = {}
+        self._trigger_states = {"left": False, "right": False}
+        self._dpad_states = {"UP": False, "DOWN": False, "LEFT": False, "RIGHT": False}
         
-        while self.running:
-            for event in pygame.event.get():
-                if event.type == pygame.JOYBUTTONDOWN:
-                    button_name = self.get_button_name(event.button)
-                    if button_name and button_name not in button_states:
-                        button_states[button_name] = True
-                        self.handle_button_press(button_name)
+        # Axes are polled once per wake rather than handled per motion event
+        self._joystick = joystick
+        self._axes = [axis for axis in AXES_OF_INTEREST if axis < joystick.get_numaxes()]
+        
+        # Trigger axes seen reading -1..1, filled in by _poll_axes
+        self._full_range_triggers = set()
+        
+        # Adopt the resting axis positions without pressing anything
+        self._poll_axes(press=False)
+        
+        iteration = 0
+        
+        while self.running and self._connected:
+            iteration += 1
+            if iteration % SAFETY_PUMP_INTERVAL == 0:
+                pygame.event.pump()
+            
+            for event in self.drain_events(self._wait_ms):
+                handler = self._dispatch.get(event.type)
+                if handler:
+                    handler(event)
+            
+            # Our joystick was closed on removal, don't poll it
+            if not self._connected:
+                break
+            
+            # Axis latency is bounded by the wait timeout, which is plenty
+            # for key mapping, so stale motion events are simply dropped
+            self._poll_axes()
+            pygame.event.clear(pygame.JOYAXISMOTION, pump=False)
+        
+        if not self._connected:
+            print("Gamepad disconnected")
+    
+    def _register_joysticks(self) -> None:
+        """Open every connected joystick that isn't registered yet"""
+        for i in range(pygame.joystick.get_count()):
+            try:
+                joystick = pygame.joystick.Joystick(i)
+            except pygame.error as e:
+                print(f"Error opening joystick {i}: {e}")
+                continue
+            self._joysticks.setdefault(joystick.get_instance_id(), joystick)
+    
+    def _on_device_added(self, event) -> None:
+        """Open a newly plugged in joystick"""
+        # The event's index may be stale after a removal, so rescan instead
+        self._register_joysticks()
+    
+    def _on_device_removed(self, event) -> None:
+        """Forget an unplugged joystick, stopping the loop if it was ours"""
+        joystick = self._joysticks.pop(event.instance_id, None)
+        if joystick is not None:
+            joystick.quit()
+        if event.instance_id == self._instance_id:
+            self._connected = False
+    
+    def _on_btn_down(self, event) -> None:
+        """Press the mapped key once per button press"""
+        button_name = self.get_button_name(event.button)
+        if self._debug:
+            logger.debug("Button ID %d -> %s", event.button, button_name)
+        if button_name and not self._button_states.get(button_name):
+            self._button_states[button_name] = True
+            self.handle_button_press(button_name)
+    
+    def _on_btn_up(self, event) -> None:
+        """Re-arm a released button"""
+        button_name = self.get_button_name(event.button)
+        if button_name:
+            self._button_states[button_name] = False
+    
+    def _poll_axes(self, press: bool = True) -> None:
+        """Read the current axis positions and turn them into trigger and D-pad presses"""
+        joystick = self._joystick
+        trigger_threshold = self._trigger_threshold
+        
+        for axis in self._axes:
+            value = joystick.get_axis(axis)
+            
+            # Handle triggers (usually axes 2 and 3)
+            if axis in [2, 3]:  # Common trigger axes
+                trigger_name = "left" if axis == 2 else "right"
                 
-                elif event.type == pygame.JOYBUTTONUP:
-                    button_name = self.get_button_name(event.button)
-                    if button_name:
-                        button_states[button_name] = False
+                # Triggers resting at -1.0 report -1..1, once one reads below
+                # -0.5 it is rescaled to 0..1 for the rest of the session
+                if value < -0.5:
+                    self._full_range_triggers.add(axis)
                 
-                elif event.type == pygame.JOYAXISMOTION:
-                    # Handle triggers (usually axes 2 and 3)
-                    if event.axis in [2, 3]:  # Common trigger axes
-                        trigger_name = "left" if event.axis == 2 else "right"
-                        threshold = self.config.get("trigger_threshold", 0.5)
-                        
-                        if abs(event.value) > threshold:
-                            if not trigger_states[trigger_name]:
-                                trigger_states[trigger_name] = True
-                                self.handle_button_press(f"{trigger_name.upper()}_TRIGGER")
-                        else:
-                            trigger_states[trigger_name] = False
-                    
-                    # Handle D-pad (if mapped to axes)
-                    elif event.axis in [0, 1]:  # X and Y axes
-                        threshold = 0.5
-                        if abs(event.value) > threshold:
-                            if event.axis == 0:  # X axis
-                                if event.value > threshold:
-                                    self.handle_button_press("DPAD_RIGHT")
-                                elif event.value < -threshold:
-                                    self.handle_button_press("DPAD_LEFT")
-                            elif event.axis == 1:  # Y axis
-                                if event.value > threshold:
-                                    self.handle_button_press("DPAD_DOWN")
-                                elif event.value < -threshold:
-                                    self.handle_button_press("DPAD_UP")
+                if axis in self._full_range_triggers:
+                    level = (value + 1) / 2
+                else:
+                    level = abs(value)
+                if self._crossed(self._trigger_states, trigger_name, level, trigger_threshold) and press:
+                    self.handle_button_press(f"{trigger_name.upper()}_TRIGGER")
             
-            time.sleep(1.0 / self.config.get("polling_rate", 60))
+            # Handle D-pad (if mapped to axes)
+            elif axis in [0, 1]:  # X and Y axes
+                threshold = 0.5
+                negative, positive = DPAD_AXIS_DIRECTIONS[axis]
+                
+                for direction, level in ((negative, -value), (positive, value)):
+                    if self._crossed(self._dpad_states, direction, level, threshold) and press:
+                        self.handle_button_press(f"DPAD_{direction}")
+    
+    def _crossed(self, states: Dict[str, bool], name: str, level: float, threshold: float) -> bool:
+        """Update a press state with hysteresis, True when it switches on"""
+        if states[name]:
+            if level <= threshold * RELEASE_RATIO:
+                states[name] = False
+            return False
+        
+        if level >= threshold:
+            states[name] = True
+            return True
+        return False
     
     def get_button_name(self, button_id: int) -> Optional[str]:
         """Map button ID to button name"""
-        # Common button mappings (may vary by controller)
-        button_mapping = {
-            0: "A",
-            1: "B", 
-            2: "X",
-            3: "Y",
-            4: "LEFT_TRIGGER",
-            5: "RIGHT_TRIGGER",
-            6: "SELECT",
-            7: "START",
-            8: "LEFT_STICK",
-            9: "RIGHT_STICK"
-        }
-        return button_mapping.get(button_id)
+        if 0 <= button_id < len(BUTTON_NAMES):
+            return BUTTON_NAMES[button_id]
+        return None
+    
+    def raise_input_priority(self) -> None:
+        """Schedule the calling (input) thread ahead of normal work"""
+        try:
+            if sys.platform == "darwin":
+                libc = ctypes.CDLL(None)
+                if libc.pthread_set_qos_class_self_np(QOS_CLASS_USER_INTERACTIVE, 0) != 0:
+                    raise OSError("pthread_set_qos_class_self_np failed")
+            elif hasattr(os, "sched_setscheduler"):
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(INPUT_THREAD_PRIORITY))
+        except (OSError, AttributeError) as e:
+            print(f"Could not raise input thread priority: {e}")
     
     def start(self) -> None:
         """Start the gamepad mapper"""
         self.running = True
         
-        while self.running:
-            # Try to detect gamepad
-            gamepad_id = self.detect_gamepad()
-            
-            if gamepad_id is not None:
-                self.gamepad = gamepad_id
+        # The key worker was started in __init__ and keeps the default priority
+        self.raise_input_priority()
+        
+        try:
+            while self.running:
+                # Try to detect gamepad
+                gamepad = self.detect_gamepad()
+                
+                if gamepad is None:
+                    if not self.config.get("auto_restart", True):
+                        print("No gamepad detected.")
+                        break
+                    
+                    print("No gamepad detected. Waiting for connection...")
+                    gamepad = self.wait_for_gamepad()
+                    if gamepad is None:
+                        break
+                
+                self.gamepad = gamepad
                 self.run_gamepad_loop()
-            else:
-                print("No gamepad detected. Waiting for connection...")
-                time.sleep(2)
                 
                 if not self.config.get("auto_restart", True):
                     break
+        finally:
+            # Shut SDL down on the input thread, once nothing is using it
+            pygame.quit()
     
     def stop(self) -> None:
-        """Stop the gamepad mapper"""
+        """Stop the gamepad mapper, safe to call from any thread"""
         self.running = False
-        pygame.quit()
+        try:
+            # Wake an input thread blocked in event.wait so start() returns
+            pygame.event.post(pygame.event.Event(self._WAKE))
+        except pygame.error:
+            pass  # start() has already shut pygame down
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Log through a background listener so callers never block on stdout"""
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+    
+    # Only this module's records, library debug output stays off stdout
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    
+    listener.start()
+    return listener
 
 def main():
     """Main entry point"""
     print("USB Gamepad Mapper for Mac")
     print("==========================")
     
+    listener = setup_logging()
     mapper = GamepadMapper()
     
     try:
@@ -245,6 +504,7 @@ def main():
         print("\nExiting...")
     finally:
         mapper.stop()
+        listener.stop()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file